@@ -3,8 +3,11 @@ import logging
 import sys
 import uuid
 
-from flask import Flask, render_template, request, jsonify
+import orjson
+from flask import Flask, Response, render_template, request, jsonify
+from flask_orjson import OrjsonProvider
 
+from session_map import SessionMap
 from ws_manager import WebsocketManager
 from ws_session import WebsocketSession
 
@@ -14,7 +17,7 @@ from ws_session import WebsocketSession
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-MODELS = [
+MODELS = (
     'tiny',
     'tiny.en',
     'base',
@@ -31,13 +34,22 @@ MODELS = [
     'distil-medium',
     'larget-v3-turbo',
     'turbo',
-]
+)
+
+# MODELS never changes at runtime, so the /models body is serialized once
+_MODELS_BODY = orjson.dumps({'status': 'success', 'models': MODELS})
+
+# Constant control-plane replies are prebuilt the same way
+_SESSION_STOPPED_BODY = orjson.dumps({'status': 'success', 'message': 'Session stopped'})
+_SESSION_NOT_FOUND_BODY = orjson.dumps({'status': 'error', 'message': 'Session not found'})
 
 logger = logging.getLogger(__name__)
 app = Flask(__name__, static_folder='static')
+# Serialize every jsonify() payload through orjson instead of the stdlib encoder
+app.json = OrjsonProvider(app)
 
 # Store active sessions
-active_sessions = {}
+active_sessions = SessionMap()
 
 
 @app.route('/')
@@ -49,10 +61,7 @@ def index():
 @app.route('/models')
 def get_models():
     """Return available STT models"""
-    try:
-        return jsonify({'status': 'success', 'models': MODELS})
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+    return Response(_MODELS_BODY, mimetype='application/json')
 
 
 @app.route('/start_session', methods=['POST'])
@@ -94,10 +103,10 @@ def start_session():
         print(f"Started WebSocket session on port {port}")
 
         # Save session information
-        active_sessions[session_id] = {
+        active_sessions.set(session_id, {
             'ws_session': ws_session,
             'websocket_port': port
-        }
+        })
 
         return jsonify({
             'status': 'success',
@@ -116,14 +125,15 @@ def start_session():
 @app.route('/stop_session/<session_id>', methods=['POST'])
 def stop_session(session_id):
     """Stop an active session"""
-    if session_id in active_sessions:
-        session = active_sessions[session_id]
+    # Pop first so concurrent stop requests for the same session cannot both stop it
+    session = active_sessions.pop(session_id)
+    if session is not None:
         session['ws_session'].stop()
-        del active_sessions[session_id]
-        return jsonify({'status': 'success', 'message': 'Session stopped'})
+        return Response(_SESSION_STOPPED_BODY, mimetype='application/json')
     else:
-        return jsonify({'status': 'error', 'message': 'Session not found'}), 404
+        return Response(_SESSION_NOT_FOUND_BODY, status=404, mimetype='application/json')
 
 
 if __name__ == '__main__':
+    # Development server only; use `gunicorn -c gunicorn.conf.py wsgi:app` in production
     app.run(host='0.0.0.0', port=8000, debug=True)
\ No newline at end of file
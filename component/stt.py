@@ -1,21 +1,45 @@
 import asyncio
-import json
+import functools
+import math
+import re
 import threading
 import queue
 import logging
+import struct
 import time
-from typing import Callable
+from typing import Callable, Protocol
 
 import numpy as np
-import base64
-from datetime import datetime
-from difflib import SequenceMatcher
-from collections import deque
+from rapidfuzz import fuzz
+from array import array
+from bisect import bisect_left
 
 import torch
+from scipy.signal import resample_poly
 from RealtimeSTT import AudioToTextRecorder
 
 
+# Probing CUDA is slow, do it once per process rather than once per session
+_CUDA_AVAILABLE = torch.cuda.is_available()
+_DEVICE = torch.device("cuda" if _CUDA_AVAILABLE else "cpu")
+# float16 runs on tensor cores on CUDA; int8 halves weight traffic on CPU
+_DEFAULT_COMPUTE_TYPE = 'float16' if _CUDA_AVAILABLE else 'int8'
+
+# Fixed little-endian header in front of each audio frame:
+# sample rate (uint32), format id (uint8), channels (uint8), 2 padding bytes
+_AUDIO_HEADER = struct.Struct('<IBBxx')
+_AUDIO_FORMAT_PCM16 = 0
+# Header sample rates outside this range mean the frame has no header
+_MIN_SAMPLE_RATE = 8000
+_MAX_SAMPLE_RATE = 192000
+
+
+class MessageSink(Protocol):
+    """Where the processor puts its messages: a queue.SimpleQueue, or a LoopQueue feeding an event loop"""
+
+    def put(self, item): ...
+
+
 class bcolors:
     HEADER = '\033[95m'
     OKBLUE = '\033[94m'
@@ -28,10 +52,30 @@ class bcolors:
     UNDERLINE = '\033[4m'
 
 
-def _decode_and_resample(audio_data, original_sample_rate, target_sample_rate):
-    """Decode and resample audio data if necessary"""
-    from scipy.signal import resample
+def _format_timestamp():
+    """Format the current local time as HH:MM:SS.mmm"""
+    now = time.time()
+    return f"{time.strftime('%H:%M:%S', time.localtime(now))}.{int(now * 1000) % 1000:03d}"
 
+
+@functools.lru_cache(maxsize=None)
+def _resample_factors(original_sample_rate, target_sample_rate):
+    """Reduce a sample rate conversion to its smallest up/down factors"""
+    g = math.gcd(original_sample_rate, target_sample_rate)
+    return target_sample_rate // g, original_sample_rate // g
+
+
+def _decode_and_resample(audio_data, original_sample_rate, target_sample_rate, out=None):
+    """
+    Decode and resample audio data if necessary
+
+    Args:
+        audio_data: 16-bit PCM audio, any bytes-like object
+        original_sample_rate: Sample rate of audio_data
+        target_sample_rate: Sample rate to resample to
+        out: Optional int16 array the resampled samples are written into when it is large enough;
+            the returned view is only valid until the next call with the same buffer
+    """
     # If sample rates match, no resampling needed
     if original_sample_rate == target_sample_rate:
         return audio_data
@@ -39,56 +83,72 @@ def _decode_and_resample(audio_data, original_sample_rate, target_sample_rate):
     # Convert bytes to numpy array
     audio_np = np.frombuffer(audio_data, dtype=np.int16)
 
-    # Calculate the number of samples after resampling
-    num_original_samples = len(audio_np)
-    num_target_samples = int(num_original_samples * target_sample_rate / original_sample_rate)
+    # Resample the audio with a polyphase filter; sample rates are fixed per
+    # stream, so the reduced up/down factors are cached
+    up, down = _resample_factors(int(original_sample_rate), int(target_sample_rate))
+    resampled_audio = resample_poly(audio_np, up, down)
 
-    # Resample the audio
-    resampled_audio = resample(audio_np, num_target_samples)
+    # Hand back the int16 samples through the buffer protocol; the recorder
+    # appends any bytes-like chunk to its buffer, so tobytes() would be an extra copy
+    if out is None or len(out) < len(resampled_audio):
+        samples = np.empty(len(resampled_audio), dtype=np.int16)
+    else:
+        samples = out[:len(resampled_audio)]
 
-    # Convert back to bytes
-    return resampled_audio.astype(np.int16).tobytes()
+    # Filter overshoot saturates instead of wrapping around, then samples are rounded to the nearest value
+    np.clip(resampled_audio, -32768, 32767, out=resampled_audio)
+    np.rint(resampled_audio, out=samples, casting='unsafe')
+    return samples.data
 
 
-def _preprocess_text(text):
-    """Preprocess the transcribed text"""
-    # Remove leading whitespaces
-    text = text.lstrip()
+_SENTENCE_END_MARKS = frozenset('.!?。')
 
-    # Remove starting ellipses if present
-    if text.startswith("..."):
-        text = text[3:]
 
-    if text.endswith("...'."):
-        text = text[:-1]
+def _ends_with_ellipsis(text):
+    """Check whether the text ends with an ellipsis, optionally followed by one character"""
+    # The end bound checks the text minus its last character without slicing a copy
+    return text.endswith("...") or text.endswith("...", 0, len(text) - 1)
 
-    if text.endswith("...'"):
-        text = text[:-1]
 
-    # Remove any leading whitespaces again after ellipses removal
-    text = text.lstrip()
+def _sentence_end(text):
+    """Check whether the text ends with a sentence end mark"""
+    return bool(text) and text[-1] in _SENTENCE_END_MARKS
 
-    # Uppercase the first letter
-    if text:
-        text = text[0].upper() + text[1:]
 
-    return text
+def _is_similar(first_text, last_text, min_similarity):
+    """Check whether the similarity ratio of two texts exceeds min_similarity"""
+    # ratio() is 2*M/T where the match count M is at most the shorter length,
+    # so texts whose lengths differ too much can be rejected without matching
+    total = len(first_text) + len(last_text)
+    if not total or 2 * min(len(first_text), len(last_text)) / total <= min_similarity:
+        return False
+    # fuzz.ratio is the same 2*M/T measure on a 0-100 scale, computed in C
+    return fuzz.ratio(first_text, last_text) / 100.0 > min_similarity
+
 
+# Leading whitespace and ellipsis (never given back, hence the atomic group), then
+# either a body ending in "...'" or "...'." whose quote suffix is dropped, or the rest
+_PREPROCESS_RE = re.compile(r"(?>\s*(?:\.\.\.)?\s*)(?:(.*\.\.\.)'\.?|(.*))\Z", re.DOTALL)
 
-def _on_transcription_start(audio_bytes):
-    """Handle transcription start event"""
-    bytes_b64 = base64.b64encode(audio_bytes.tobytes()).decode('utf-8')
-    message = json.dumps({
-        'type': 'transcription_start',
-        'audio_bytes_base64': bytes_b64
-    })
-    #asyncio.run_coroutine_threadsafe(self.websocket.send(message), self.loop)
+
+def _preprocess_text(text):
+    """Preprocess the transcribed text"""
+    # Most realtime hypotheses are already clean: capitalized, with nothing to strip
+    if text and text[0].isupper() and not text.endswith(("'", "'.")):
+        return text
+
+    # Strip leading whitespace/ellipsis and the trailing quote after an ellipsis
+    match = _PREPROCESS_RE.match(text)
+    text = match.group(1) or match.group(2)
+
+    # Uppercase the first letter
+    return text[:1].upper() + text[1:]
 
 
 class STTProcessor(threading.Thread):
     """Speech-to-Text processor that runs in its own thread"""
 
-    def __init__(self, config, output_queue : queue.Queue):
+    def __init__(self, config, output_queue : MessageSink):
         """
         Initialize the STT processor
 
@@ -105,9 +165,17 @@ class STTProcessor(threading.Thread):
         self.recorder = None
         self.logger = logging.getLogger("STTProcessor")
 
+        # Bounded queue of (audio, sample_rate) chunks waiting to be fed to the recorder
+        self.audio_queue = queue.Queue(maxsize=config.get('audio_queue_size', 32))
+        self.audio_thread = None
+        # Reused by the audio feeder for resampled chunks, which the recorder copies into its own buffer
+        self.resample_out = np.empty(config.get('resample_buffer_samples', 16384), dtype=np.int16)
+
         # Initialize state variables
         self.prev_text = ""
-        self.text_time_deque = deque()
+        # Realtime texts within the background noise window, with their timestamps
+        self.text_times = array('d')
+        self.texts = []
 
         # Configuration for silence timing
         self.silence_timing = config.get('silence_timing', False)
@@ -115,6 +183,10 @@ class STTProcessor(threading.Thread):
         self.hard_break_even_on_background_noise_min_texts = config.get('hard_break_even_on_background_noise_min_texts', 5)
         self.hard_break_even_on_background_noise_min_similarity = config.get('hard_break_even_on_background_noise_min_similarity', 0.99)
         self.hard_break_even_on_background_noise_min_chars = config.get('hard_break_even_on_background_noise_min_chars', 15)
+        self.mid_sentence_detection_pause = config.get('mid_sentence_detection_pause', 1.0)
+        self.end_of_sentence_detection_pause = config.get('end_of_sentence_detection_pause', 2.0)
+        self.unknown_sentence_detection_pause = config.get('unknown_sentence_detection_pause', 1.5)
+        self.extended_logging = config.get('extended_logging', False)
         print("Constructing STT completed")
 
 
@@ -135,11 +207,10 @@ class STTProcessor(threading.Thread):
             for key, value in self.config.items():
                 print(f"    {bcolors.OKBLUE}{key}{bcolors.ENDC}: {value}")
 
-            # Check if GPU is available
-            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            device = _DEVICE
             print(f"Using device: {device}")
 
-            compute_type = 'int8_float32' if device.type == 'cpu' else 'float32'
+            compute_type = self.config.get('compute_type', _DEFAULT_COMPUTE_TYPE)
 
             # Configure STT recorder
             self.recorder = AudioToTextRecorder(
@@ -169,12 +240,17 @@ class STTProcessor(threading.Thread):
                 on_recording_stop=self._on_recording_stop,
                 on_vad_detect_start=self._on_vad_detect_start,
                 on_vad_detect_stop=self._on_vad_detect_stop,
-                on_transcription_start=_on_transcription_start,
+                on_transcription_start=self._on_transcription_start,
                 on_turn_detection_start=self._on_turn_detection_start,
                 on_turn_detection_stop=self._on_turn_detection_stop,
             )
 
             print(f"{bcolors.OKGREEN}{bcolors.BOLD}STT processor initialized{bcolors.ENDC}")
+
+            # Feed incoming audio from a separate thread, text() below blocks
+            self.audio_thread = threading.Thread(target=self._feed_audio_loop, daemon=True)
+            self.audio_thread.start()
+
             # Run the coroutine in this thread's event loop
             while self.running:
                 self.recorder.text(self._process_text)
@@ -197,46 +273,68 @@ class STTProcessor(threading.Thread):
         })
 
     def process_audio_data(self, audio_data):
-        """Process audio data received from WebSocket"""
+        """
+        Parse audio data received from WebSocket and queue it for the recorder.
+        Resampling and feeding happen on the audio feeder thread, so the
+        WebSocket thread never waits on them.
+        """
         try:
-            # Check if audio data contains metadata
-            if isinstance(audio_data, bytes) and len(audio_data) > 4:
-                # Check for metadata header
-                metadata_length = int.from_bytes(audio_data[:4], byteorder='little')
-
-                if 0 < metadata_length < len(audio_data) - 4:
-                    # Extract metadata and audio
-                    metadata_bytes = audio_data[4:4 + metadata_length]
-                    audio_bytes = audio_data[4 + metadata_length:]
-
-                    try:
-                        # Parse metadata
-                        metadata = json.loads(metadata_bytes.decode('utf-8'))
-                        sample_rate = metadata.get('sampleRate', 48000)
-                        format_type = metadata.get('format', 'webm')
-                        channels = metadata.get('channels', 1)
-
-                        # Process the audio with the recorder
-                        if self.recorder:
-                            # Resample if needed and feed to recorder
-                            processed_audio = _decode_and_resample(
-                                audio_bytes,
-                                sample_rate,
-                                self.recorder.sample_rate
-                            )
-                            self.recorder.feed_audio(processed_audio)
-                    except json.JSONDecodeError:
-                        print("Failed to parse audio metadata JSON")
-                else:
-                    # No metadata, assume default format
-                    self.recorder.feed_audio(audio_data)
-            else:
-                # No metadata, assume default format
-                self.recorder.feed_audio(audio_data)
+            if not self.recorder:
+                return
+
+            # None means the audio is fed as-is
+            sample_rate = None
+
+            # Check if audio data carries the binary header; frames from headerless clients
+            # don't describe mono PCM16 at a sane rate and are fed as raw PCM
+            if isinstance(audio_data, bytes) and len(audio_data) > _AUDIO_HEADER.size:
+                header_rate, format_id, channels = _AUDIO_HEADER.unpack_from(audio_data, 0)
+                if (format_id == _AUDIO_FORMAT_PCM16 and channels == 1 and
+                        (header_rate == 0 or _MIN_SAMPLE_RATE <= header_rate <= _MAX_SAMPLE_RATE)):
+                    # Slice the audio without copying the frame
+                    audio_data = memoryview(audio_data)[_AUDIO_HEADER.size:]
+                    if header_rate:
+                        sample_rate = header_rate
+
+            self._queue_audio((audio_data, sample_rate))
 
         except Exception as e:
             print(f"Error processing audio data: {str(e)}")
 
+    def _queue_audio(self, item):
+        """Queue an audio chunk, dropping the oldest one when the queue is full"""
+        try:
+            self.audio_queue.put_nowait(item)
+        except queue.Full:
+            # Falling behind: drop stale audio rather than adding latency
+            try:
+                self.audio_queue.get_nowait()
+            except queue.Empty:
+                pass
+            self.audio_queue.put_nowait(item)
+
+    def _feed_audio_loop(self):
+        """Resample queued audio chunks and feed them to the recorder"""
+        while True:
+            # Blocks until audio arrives; stop() wakes it with a None sentinel
+            item = self.audio_queue.get()
+            if item is None or not self.running:
+                break
+
+            audio_data, sample_rate = item
+            try:
+                if sample_rate is not None:
+                    # Resample if needed and feed to recorder
+                    audio_data = _decode_and_resample(
+                        audio_data,
+                        sample_rate,
+                        self.recorder.sample_rate,
+                        self.resample_out
+                    )
+                self.recorder.feed_audio(audio_data)
+            except Exception as e:
+                print(f"Error feeding audio data: {str(e)}")
+
     def _start_listening(self):
         """Start listening for audio"""
         if self.recorder:
@@ -256,46 +354,33 @@ class STTProcessor(threading.Thread):
         text = _preprocess_text(text)
 
         if self.silence_timing:
-            def ends_with_ellipsis(t):
-                if t.endswith("..."):
-                    return True
-                if len(t) > 1 and t[:-1].endswith("..."):
-                    return True
-                return False
-
-            def sentence_end(t):
-                sentence_end_marks = ['.', '!', '?', '。']
-                if t and t[-1] in sentence_end_marks:
-                    return True
-                return False
-
-            if ends_with_ellipsis(text):
-                self.recorder.post_speech_silence_duration = self.config.get('mid_sentence_detection_pause', 1.0)
-            elif sentence_end(text) and sentence_end(self.prev_text) and not ends_with_ellipsis(self.prev_text):
-                self.recorder.post_speech_silence_duration = self.config.get('end_of_sentence_detection_pause', 2.0)
+            if _ends_with_ellipsis(text):
+                self.recorder.post_speech_silence_duration = self.mid_sentence_detection_pause
+            elif _sentence_end(text) and _sentence_end(self.prev_text) and not _ends_with_ellipsis(self.prev_text):
+                self.recorder.post_speech_silence_duration = self.end_of_sentence_detection_pause
             else:
-                self.recorder.post_speech_silence_duration = self.config.get('unknown_sentence_detection_pause', 1.5)
+                self.recorder.post_speech_silence_duration = self.unknown_sentence_detection_pause
 
             # Append the new text with its timestamp
             current_time = time.time()
-            self.text_time_deque.append((current_time, text))
-
-            # Remove texts older than hard_break_even_on_background_noise seconds
-            while self.text_time_deque and self.text_time_deque[0][
-                0] < current_time - self.hard_break_even_on_background_noise:
-                self.text_time_deque.popleft()
-
-            # Check if we have enough texts in the queue and they're similar
-            if len(self.text_time_deque) >= self.hard_break_even_on_background_noise_min_texts:
-                texts = [t[1] for t in self.text_time_deque]
-                first_text = texts[0]
-                last_text = texts[-1]
-
-                # Compute the similarity ratio between the first and last texts
-                similarity = SequenceMatcher(None, first_text, last_text).ratio()
-
-                if (similarity > self.hard_break_even_on_background_noise_min_similarity and
-                        len(first_text) > self.hard_break_even_on_background_noise_min_chars):
+            self.text_times.append(current_time)
+            self.texts.append(text)
+
+            # Remove texts older than hard_break_even_on_background_noise seconds;
+            # timestamps are ascending, so the cut point is found by bisection
+            cut = bisect_left(self.text_times, current_time - self.hard_break_even_on_background_noise)
+            if cut:
+                del self.text_times[:cut]
+                del self.texts[:cut]
+
+            # Check if we have enough texts in the window and they're similar
+            if len(self.texts) >= self.hard_break_even_on_background_noise_min_texts:
+                first_text = self.texts[0]
+                last_text = self.texts[-1]
+
+                # Check the cheap length condition before comparing the texts
+                if (len(first_text) > self.hard_break_even_on_background_noise_min_chars and
+                        _is_similar(first_text, last_text, self.hard_break_even_on_background_noise_min_similarity)):
                     self.recorder.stop()
                     self.recorder.clear_audio_queue()
                     self.prev_text = ""
@@ -309,12 +394,11 @@ class STTProcessor(threading.Thread):
             'is_final': False
         })
 
-        # Log the message
-        timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
-        if self.config.get('extended_logging', False):
-            print(f"  [{timestamp}] Realtime text: {bcolors.OKCYAN}{text}{bcolors.ENDC}\n", flush=True, end="")
-        else:
-            print(f"\r[{timestamp}] {bcolors.OKCYAN}{text}{bcolors.ENDC}", flush=True, end='')
+        # Log the message; nothing is formatted unless someone is listening
+        if self.extended_logging:
+            print(f"  [{_format_timestamp()}] Realtime text: {bcolors.OKCYAN}{text}{bcolors.ENDC}\n", flush=True, end="")
+        elif self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("Realtime text: %s", text)
 
     def _on_recording_start(self):
         """Handle recording start event"""
@@ -340,6 +424,13 @@ class STTProcessor(threading.Thread):
             'type': 'vad_detect_stop'
         })
 
+    def _on_transcription_start(self, _audio_bytes):
+        """Handle transcription start event"""
+        # The client only needs the event; the recorded audio is not sent back
+        self.output_queue.put({
+            'type': 'transcription_start'
+        })
+
     def _on_turn_detection_start(self):
         print("&&& stt_server on_turn_detection_start")
         self.output_queue.put({
@@ -370,4 +461,8 @@ class STTProcessor(threading.Thread):
             except Exception as e:
                 print(f"Error stopping recorder: {str(e)}")
 
+        if self.audio_thread:
+            self._queue_audio(None)
+            self.audio_thread.join(timeout=1)
+
         self.join(500)
\ No newline at end of file
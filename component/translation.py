@@ -1,9 +1,13 @@
 # component/translation.py
+import functools
+import gc
 import threading
 import queue
 import logging
+import os
 import time
 from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Callable
 
 import torch
@@ -11,7 +15,153 @@ from transformers import M2M100ForConditionalGeneration, M2M100Tokenizer
 
 
 logger = logging.getLogger("TranslationProcessor")
-logger.setLevel(logging.DEBUG)
+
+# CTranslate2 translators shared by all sessions, keyed by model path, device, compute type and thread layout
+_TRANSLATORS = {}
+_TRANSLATORS_LOCK = threading.Lock()
+
+
+def get_translator(model_path, device, compute_type, inter_threads=1, intra_threads=0):
+    """
+    Get the CTranslate2 translator for a model, loading and warming it up on first use
+
+    Args:
+        model_path: Directory of the converted CTranslate2 model
+        device: 'cpu' or 'cuda'
+        compute_type: CTranslate2 compute type, e.g. 'int8' or 'int8_float16'
+        inter_threads: Number of batches translated in parallel
+        intra_threads: Threads used per batch on CPU, 0 for the CTranslate2 default
+
+    Returns:
+        The shared ctranslate2.Translator
+    """
+    key = (model_path, device, compute_type, inter_threads, intra_threads)
+    with _TRANSLATORS_LOCK:
+        translator = _TRANSLATORS.get(key)
+        if translator is None:
+            import ctranslate2
+            translator = ctranslate2.Translator(
+                model_path,
+                device=device,
+                compute_type=compute_type,
+                inter_threads=inter_threads,
+                intra_threads=intra_threads
+            )
+            translator.translate_batch([["__en__", "▁hello", "</s>"]], target_prefix=[["__fr__"]])
+            _TRANSLATORS[key] = translator
+    return translator
+
+
+class TranslationService:
+    """
+    Feeds the CTranslate2 requests of every session through one translator,
+    merging those that arrive close together into a single translate_batch call
+    """
+
+    def __init__(self, translator, max_batch_tokens=1024, batch_window=0.02):
+        """
+        Initialize the translation service and start its worker thread
+
+        Args:
+            translator: The shared ctranslate2.Translator
+            max_batch_tokens: Token budget of each batch the merged requests are split into
+            batch_window: Seconds to wait for other requests after the first one arrives
+        """
+        self.translator = translator
+        self.max_batch_tokens = max_batch_tokens
+        self.batch_window = batch_window
+        self.requests = queue.SimpleQueue()  # (source tokens, target prefix, beam size, max length, future)
+        self.thread = threading.Thread(target=self._run, name="TranslationService", daemon=True)
+        self.thread.start()
+
+    def translate(self, source, target_prefix, beam_size=1, max_decoding_length=256):
+        """
+        Queue one tokenized sentence for translation
+
+        Args:
+            source: Source token strings
+            target_prefix: Decoder prefix, the target language token
+            beam_size: Beam size to decode with
+            max_decoding_length: Upper bound on the translation length
+
+        Returns:
+            Future resolving to the best hypothesis tokens
+        """
+        future = Future()
+        self.requests.put((source, target_prefix, beam_size, max_decoding_length, future))
+        return future
+
+    def _run(self):
+        """Collect the requests arriving within the batch window and translate them together"""
+        while True:
+            pending = [self.requests.get()]
+            try:
+                deadline = time.monotonic() + self.batch_window
+                while (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        pending.append(self.requests.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+                # Requests can only share a call when they decode with the same beam size
+                by_beam_size = {}
+                for request in pending:
+                    by_beam_size.setdefault(request[2], []).append(request)
+                for beam_size, requests in by_beam_size.items():
+                    self._translate(beam_size, requests)
+
+            except Exception as e:
+                # Keep serving the other sessions; whoever is still waiting gets the error
+                logger.error(f"Error in translation service: {str(e)}", exc_info=True)
+                for request in pending:
+                    if not request[4].done():
+                        request[4].set_exception(e)
+
+    def _translate(self, beam_size, requests):
+        """Translate merged requests and resolve their futures"""
+        try:
+            # translate_batch sorts by length and splits into token-budget batches itself.
+            # Merged requests decode up to the longest limit among them; each hypothesis is cut back to
+            # its own request's limit below, which matches decoding it alone when the search is greedy
+            results = self.translator.translate_batch(
+                [request[0] for request in requests],
+                target_prefix=[request[1] for request in requests],
+                beam_size=beam_size,
+                max_decoding_length=max(request[3] for request in requests),
+                max_batch_size=self.max_batch_tokens,
+                batch_type='tokens'
+            )
+        except Exception as e:
+            for request in requests:
+                request[4].set_exception(e)
+            return
+
+        for request, result in zip(requests, results):
+            request[4].set_result(result.hypotheses[0][:request[3]])
+
+
+# Translation services, one per shared translator
+_SERVICES = {}
+
+
+def get_translation_service(translator, max_batch_tokens=1024, batch_window=0.02):
+    """
+    Get the translation service of a shared translator, starting it on first use
+
+    Args:
+        translator: The shared ctranslate2.Translator
+        max_batch_tokens: Token budget per batch, taken from the first session
+        batch_window: Seconds to wait for other requests, taken from the first session
+
+    Returns:
+        The TranslationService
+    """
+    with _TRANSLATORS_LOCK:
+        service = _SERVICES.get(id(translator))
+        if service is None:
+            service = TranslationService(translator, max_batch_tokens, batch_window)
+            _SERVICES[id(translator)] = service
+    return service
 
 class TranslationProcessor(threading.Thread):
     """Translation processor that runs in its own thread"""
@@ -33,23 +183,38 @@ class TranslationProcessor(threading.Thread):
         self.running = False
 
         # Translation buffer
-        self.translation_buffer = []  # Buffer to store sentences for batch translation
-        self.sentence_timestamps = []  # Timestamps for when sentences were added
+        self.translation_buffer = deque()  # (sentence, timestamp added, token ids future) for batch translation
+        # Sentences are tokenized off the translation thread as they arrive
+        self.tokenize_pool = ThreadPoolExecutor(max_workers=config.get('tokenizer_workers', 2))
 
         # Batch translation configuration
         self.batch_size = config.get('batch_size', 3)  # Translate when buffer reaches this size
         self.max_wait_time = config.get('max_wait_time', 2.0)  # Seconds to wait before translating
+        self.max_tokens_per_batch = config.get('max_tokens_per_batch', 1024)  # Padded tokens per generate call
+        self.num_beams = config.get('num_beams', 1)  # Greedy decoding by default, the model's own default is 5 beams
+        self.max_new_tokens = config.get('max_new_tokens', 256)  # Upper bound on translation length
 
         # Translation model configuration
         self.model_name = config.get('model', 'facebook/m2m100_418M')
+        self.backend = config.get('backend', 'transformers')  # 'transformers' or 'ctranslate2'
+        # Token streaming decodes one sentence at a time with greedy search, so it needs CTranslate2 and one beam
+        self.stream_partials = (config.get('stream_partials', False) and self.backend == 'ctranslate2'
+                                and self.num_beams == 1)
+        self.partial_every_tokens = config.get('partial_every_tokens', 4)  # Decoded tokens between partial sends
         self.source_language = config.get('source_language', 'en')
         self.target_language = config.get('target_language', 'vi')
         self.device = torch.device(
             "cuda" if torch.cuda.is_available() and not config.get('force_cpu', False) else "cpu")
+        # Weights and activations on the GPU are stored in this dtype; the CPU always runs in float32
+        self.dtype = getattr(torch, config.get('dtype', 'float16')) if self.device.type == 'cuda' else torch.float32
 
         # Initialize model and tokenizer as None, will load in run()
         self.model = None
         self.tokenizer = None
+        self.forced_bos_token_id = None
+        self.target_prefix = None
+        self.pad_buckets = ()  # Source lengths inputs are padded up to once the model is compiled
+        self.service = None  # TranslationService shared with the other sessions on the ctranslate2 backend
 
         print(f"Initialized TranslationProcessor with device: {self.device}")
 
@@ -74,30 +239,53 @@ class TranslationProcessor(threading.Thread):
             # Load model and tokenizer
             start_time = time.time()
             print(f"Loading translation model {self.model_name}...")
-            self.model = M2M100ForConditionalGeneration.from_pretrained(self.model_name).to(self.device)
+            if self.backend == 'ctranslate2':
+                self.model = self._load_ct2_translator()
+                self.service = get_translation_service(
+                    self.model,
+                    self.max_tokens_per_batch,
+                    self.config.get('batch_window', 0.02)
+                )
+            else:
+                self.model = self._load_model()
             self.tokenizer = M2M100Tokenizer.from_pretrained(self.model_name)
             self.tokenizer.src_lang = self.source_language
+            self.forced_bos_token_id = self.tokenizer.get_lang_id(self.target_language)
+            self.target_prefix = [self.tokenizer.get_lang_token(self.target_language)]
+            # The shared CTranslate2 translator is warmed up once by get_translator, not per session
+            if self.backend != 'ctranslate2':
+                if self.config.get('torch_compile', False):
+                    self._compile_model()
+                elif self.config.get('warmup', True):
+                    # Pay for kernel selection and allocator growth here rather than on the first real sentence
+                    self._generate([self._tokenize("Warmup")])
             print(f"Model loaded in {time.time() - start_time:.2f} seconds")
 
             # Process the input queue
             while self.running:
                 try:
-                    # Check for new messages
-                    while not self.input_queue.empty():
-                        message = self.input_queue.get(block=False)
-
+                    # Block until a message arrives or the oldest buffered sentence reaches its deadline
+                    timeout = None
+                    if self.translation_buffer:
+                        timeout = max(0.0, self.max_wait_time - (time.time() - self.translation_buffer[0][1]))
+
+                    try:
+                        message = self.input_queue.get(timeout=timeout)
+                    except queue.Empty:
+                        message = None
+
+                    # None is also what stop() queues to wake the thread
+                    if message is not None:
                         if message['type'] == 'transcription' and message.get('is_final', False):
                             # Add the sentence to the buffer with a timestamp
-                            self.translation_buffer.append(message['text'])
-                            self.sentence_timestamps.append(time.time())
-                            print(f"Added sentence to translation buffer: {message['text']}")
+                            self._buffer_sentence(message['text'])
+                            logger.debug("Added sentence to translation buffer: %s", message['text'])
 
                         elif message['type'] == 'command':
                             command = message['command']
                             if command == 'translate':
                                 # Force translation of current buffer
-                                self.translation_buffer.append(message['text'])
-                                self.sentence_timestamps.append(time.time())
+                                self._buffer_sentence(message['text'])
                             elif command == 'shutdown':
                                 # Translate any remaining text and exit
                                 if self.translation_buffer:
@@ -113,17 +301,12 @@ class TranslationProcessor(threading.Thread):
                         should_translate = True
 
                     # Translate if oldest sentence has been waiting too long
-                    elif self.translation_buffer and (current_time - self.sentence_timestamps[0] >= self.max_wait_time):
+                    elif self.translation_buffer and (current_time - self.translation_buffer[0][1] >= self.max_wait_time):
                         should_translate = True
 
                     if should_translate:
                         self._translate_buffer()
 
-                    # Small sleep to prevent CPU hogging
-                    time.sleep(0.1)
-
-                except queue.Empty:
-                    pass
                 except Exception as e:
                     logger.error(f"Error in translation processing: {str(e)}", exc_info=True)
 
@@ -133,55 +316,247 @@ class TranslationProcessor(threading.Thread):
             self.stop()
             print("Translation processor stopped")
 
+    def _load_model(self):
+        """Load the translation model, quantized to int8 unless disabled in the config"""
+        if self.device.type == 'cuda' and self.config.get('load_in_8bit', False):
+            # Weight-only int8 through bitsandbytes; from_pretrained places the model on the GPU
+            from transformers import BitsAndBytesConfig
+            return M2M100ForConditionalGeneration.from_pretrained(
+                self.model_name,
+                quantization_config=BitsAndBytesConfig(load_in_8bit=True),
+                device_map='auto'
+            )
+
+        # Loading straight into half precision (float16, or bfloat16 on Ampere and newer) maps the
+        # matmuls to tensor cores and halves weight traffic, without materializing float32 weights first
+        model = M2M100ForConditionalGeneration.from_pretrained(
+            self.model_name,
+            torch_dtype=self.dtype
+        ).to(self.device)
+        if self.device.type != 'cuda' and self.config.get('quantize', True):
+            # Dynamic int8 quantization of the Linear layers, which dominate memory traffic on CPU
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def _load_ct2_translator(self):
+        """Get the shared CTranslate2 int8 conversion of the model"""
+        # Converted offline with: ct2-transformers-converter --model facebook/m2m100_418M
+        #     --quantization int8 --output_dir m2m100_ct2
+        compute_type = self.config.get(
+            'ct2_compute_type', 'int8_float16' if self.device.type == 'cuda' else 'int8')
+        # On CPU the GEMMs scale with intra_threads up to the physical cores; inter_threads
+        # lets the batches queued by one flush (or by several sessions) run side by side
+        return get_translator(
+            self.config.get('ct2_model_path', 'm2m100_ct2'),
+            self.device.type,
+            compute_type,
+            inter_threads=self.config.get('inter_threads', 1),
+            intra_threads=self.config.get('intra_threads', os.cpu_count() or 0)
+        )
+
+    def _compile_model(self):
+        """Compile the model forward pass and warm it up so the first sentence doesn't pay for compilation"""
+        # dynamic=True keeps the growing decoder length from triggering a recompile per step
+        self.model.forward = torch.compile(self.model.forward, mode='reduce-overhead', dynamic=True)
+
+        # Padding sources up to a few fixed lengths bounds the number of shapes the
+        # CUDA graphs are recorded for; each bucket is warmed up once here
+        self.pad_buckets = tuple(sorted(self.config.get('compile_pad_buckets', (64, 128, 256))))
+        warmup_ids = self.tokenizer("Warmup")['input_ids']
+        for length in self.pad_buckets:
+            # Repeat the sentence body so the input fills the bucket, keeping one language token
+            # at the start and the end of sentence token at the end
+            self._generate([warmup_ids[:1] + (warmup_ids[1:-1] * length)[:length - 2] + warmup_ids[-1:]])
+        print(f"Translation model compiled for source lengths {self.pad_buckets}")
+
+    def _to_device(self, encoded):
+        """Move encoded inputs to the model device"""
+        if self.device.type != 'cuda':
+            return encoded
+
+        # Copies from pinned host memory run asynchronously, overlapping the GPU work still queued
+        return {key: tensor.pin_memory().to(self.device, non_blocking=True) for key, tensor in encoded.items()}
+
+    def _tokenize(self, sentence):
+        """Tokenize a sentence into its token ids"""
+        return self.tokenizer(sentence, truncation=True)['input_ids']
+
+    def _buffer_sentence(self, sentence):
+        """Start tokenizing a sentence on arrival and add it to the translation buffer"""
+        self.translation_buffer.append((sentence, time.time(), self.tokenize_pool.submit(self._tokenize, sentence)))
+
+    def _token_batches(self, pending):
+        """
+        Group pending sentences by token length so that no batch pads to more than max_tokens_per_batch tokens
+
+        Args:
+            pending: List of (sentence, timestamp, token ids) entries
+
+        Returns:
+            List of batches, each a list of indices into pending
+        """
+        # Sorting by length keeps similar lengths together, so little of each batch is padding
+        order = sorted(range(len(pending)), key=lambda i: len(pending[i][2]))
+
+        batches = []
+        batch = []
+        for i in order:
+            # Lengths are ascending, so the batch pads to the sentence being added
+            if batch and len(pending[i][2]) * (len(batch) + 1) > self.max_tokens_per_batch:
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _pad_batch(self, batch_ids):
+        """Pad a batch of token id lists to the smallest bucket that fits, or to its longest sequence"""
+        longest = max(len(input_ids) for input_ids in batch_ids)
+        bucket = next((length for length in self.pad_buckets if length >= longest), None)
+        if bucket is None:
+            return self.tokenizer.pad({'input_ids': batch_ids}, return_tensors="pt")
+        return self.tokenizer.pad({'input_ids': batch_ids}, padding='max_length', max_length=bucket,
+                                  return_tensors="pt")
+
+    def _generate(self, batch_ids):
+        """
+        Translate one batch of pre-tokenized sentences with a single generate call
+
+        Args:
+            batch_ids: List of token id lists
+
+        Returns:
+            List of translated texts, in batch order
+        """
+        if self.backend == 'ctranslate2':
+            return self._submit_ct2(batch_ids)()
+
+        encoded = self._to_device(self._pad_batch(batch_ids))
+        with torch.inference_mode(), torch.autocast(device_type=self.device.type, dtype=self.dtype,
+                                                    enabled=self.dtype != torch.float32):
+            # A translation rarely runs past twice its source length, so decoding stops there at the latest
+            generated_tokens = self.model.generate(
+                **encoded,
+                forced_bos_token_id=self.forced_bos_token_id,
+                num_beams=self.num_beams,
+                do_sample=False,
+                max_new_tokens=min(self.max_new_tokens, encoded['input_ids'].shape[1] * 2),
+                use_cache=True
+            )
+
+        return self.tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+
+    def _submit_ct2(self, batch_ids):
+        """
+        Queue one batch of pre-tokenized sentences for translation with CTranslate2
+
+        Args:
+            batch_ids: List of token id lists
+
+        Returns:
+            Function that waits for the batch and returns its translated texts, in batch order
+        """
+        # CTranslate2 works on token strings; the target language token is forced as the decoder prefix.
+        # The service merges these with the other sessions' requests into shared batches
+        futures = [
+            self.service.translate(
+                tokens,
+                self.target_prefix,
+                beam_size=self.num_beams,
+                max_decoding_length=min(self.max_new_tokens, len(tokens) * 2)
+            )
+            for tokens in (self.tokenizer.convert_ids_to_tokens(input_ids) for input_ids in batch_ids)
+        ]
+
+        def wait():
+            return [
+                self.tokenizer.decode(self.tokenizer.convert_tokens_to_ids(future.result()), skip_special_tokens=True)
+                for future in futures
+            ]
+        return wait
+
+    def _stream_ct2(self, sentence, input_ids):
+        """
+        Translate one pre-tokenized sentence with CTranslate2, sending the partial translation as it is decoded
+
+        Args:
+            sentence: The source sentence
+            input_ids: Its token ids
+
+        Returns:
+            List holding the translated text, like _generate
+        """
+        source = self.tokenizer.convert_ids_to_tokens(input_ids)
+        token_ids = []
+        for step in self.model.generate_tokens(
+                source,
+                target_prefix=self.target_prefix,
+                max_decoding_length=min(self.max_new_tokens, len(source) * 2)
+        ):
+            token_ids.append(self.tokenizer.convert_tokens_to_ids(step.token))
+            if len(token_ids) % self.partial_every_tokens == 0 and not step.is_last:
+                # Partials go out as non-final translations, which the client already renders as they update
+                self.output_queue.put({
+                    'type': 'translation',
+                    'original': sentence,
+                    'translated': self.tokenizer.decode(token_ids, skip_special_tokens=True),
+                    'is_final': False
+                })
+
+        return [self.tokenizer.decode(token_ids, skip_special_tokens=True)]
+
     def _translate_buffer(self):
         """Translate all sentences in the buffer"""
         if not self.translation_buffer:
             return
 
         try:
-            print(f"Translating batch of {len(self.translation_buffer)} sentences")
-
-            results = []
-            # Process each sentence
-            for i, sentence in enumerate(self.translation_buffer):
-                start_time = time.time()
-
-                # Encode and translate
-                encoded = self.tokenizer(sentence, return_tensors="pt").to(self.device)
-                generated_tokens = self.model.generate(
-                    **encoded,
-                    forced_bos_token_id=self.tokenizer.get_lang_id(self.target_language)
-                )
+            pending = [(sentence, timestamp, future.result()) for sentence, timestamp, future in self.translation_buffer]
+            batches = self._token_batches(pending)
+            logger.debug("Translating %d sentences in %d batches", len(pending), len(batches))
 
-                # Decode the result
-                translated_text = self.tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)[0]
-
-                # Create result object
-                result = {
-                    'original': sentence,
-                    'translated': translated_text,
-                    'processing_time': time.time() - start_time
-                }
-                results.append(result)
-
-                print(f"Translated: {sentence} → {translated_text}")
+            start_time = time.time()
+            if self.stream_partials:
+                # Sentences are decoded one at a time in arrival order, so partials appear in the order spoken
+                submitted = [([i], functools.partial(self._stream_ct2, pending[i][0], pending[i][2]))
+                             for i in range(len(pending))]
+            elif self.backend == 'ctranslate2':
+                # Queue every batch up front so the service merges them into as few translate_batch calls as it can
+                submitted = [(batch, self._submit_ct2([pending[i][2] for i in batch])) for batch in batches]
+            else:
+                submitted = [(batch, functools.partial(self._generate, [pending[i][2] for i in batch]))
+                             for batch in batches]
+
+            # Scatter the results back so translations go out in arrival order
+            results = [None] * len(pending)
+            for batch, wait in submitted:
+                translated_texts = wait()
+                # Time from the flush until this batch was ready
+                processing_time = time.time() - start_time
+                for i, translated_text in zip(batch, translated_texts):
+                    results[i] = (pending[i][0], translated_text, processing_time)
 
             # Send all results to output queue
-            for result in results:
+            for sentence, translated_text, processing_time in results:
+                logger.debug("Translated: %s -> %s", sentence, translated_text)
                 self.output_queue.put({
                     'type': 'translation',
-                    'original': result['original'],
-                    'translated': result['translated'],
+                    'original': sentence,
+                    'translated': translated_text,
                     'is_final': True,
-                    'processing_time': result['processing_time']
+                    'processing_time': processing_time
                 })
 
-            # Clear the buffer and timestamps
-            self.translation_buffer = []
-            self.sentence_timestamps = []
+            # Clear the buffer
+            self.translation_buffer.clear()
 
         except Exception as e:
-            logger.error(f"Error translating buffer: {str(e)}", exc_info=True)
+            # Drop the failed sentences; kept in the buffer they are past their deadline, and the
+            # run loop would retry them immediately on every pass
+            logger.error(f"Error translating buffer, dropping {len(self.translation_buffer)} sentences: {str(e)}",
+                         exc_info=True)
+            self.translation_buffer.clear()
 
     def stop(self):
         """Stop the translation processor"""
@@ -190,6 +565,13 @@ class TranslationProcessor(threading.Thread):
 
         print("Stopping translation processor")
         self.running = False
+        # Wake the run loop if it is blocked waiting for input
+        self.input_queue.put(None)
+        # Let it finish the message or flush in hand, so nothing is submitted to the pool after shutdown
+        if threading.current_thread() is not self and self.is_alive():
+            self.join(self.config.get('stop_timeout', 10.0))
+            if self.is_alive():
+                logger.warning("Translation thread still running after stop timeout, shutting down anyway")
 
         # Translate any remaining sentences
         if self.translation_buffer:
@@ -199,6 +581,11 @@ class TranslationProcessor(threading.Thread):
                 pass
 
         # Release resources
+        self.tokenize_pool.shutdown(wait=False)
         self.model = None
+        self.service = None
         self.tokenizer = None
-        torch.cuda.empty_cache()  # Free GPU memory if using CUDA
\ No newline at end of file
+        gc.collect()
+        # The caching allocator keeps the freed blocks for the next session unless asked to give them back
+        if self.device.type == 'cuda' and self.config.get('release_gpu_on_stop', False):
+            torch.cuda.empty_cache()
\ No newline at end of file
@@ -0,0 +1,12 @@
+# gunicorn.conf.py
+# active_sessions is in-process state: /stop_session must reach the worker that
+# served /start_session, so keep one worker and serve requests from a thread pool.
+bind = '0.0.0.0:8000'
+workers = 1
+worker_class = 'gthread'
+threads = 8
+# Model loading in /start_session can take a while on first use
+timeout = 120
+# Keep idle client connections open so the browser can reuse them for
+# /models, /start_session and /stop_session instead of reconnecting each time
+keepalive = 30
@@ -1,8 +1,12 @@
+import logging
 from typing import Callable
 
 from component.stt import STTProcessor
 
 
+logger = logging.getLogger("AudioSocketHandler")
+
+
 class AudioSocketHandler:
     def __init__(self, stt : STTProcessor, tts = None):
         self.stt = stt
@@ -13,5 +17,6 @@ class AudioSocketHandler:
         This method should be called when new audio data is received.
         """
         if self.stt:
-            self.stt.process_audio_data(bytes)
-            print(f"Audio data sent to STT: {len(data)} bytes")
\ No newline at end of file
+            self.stt.process_audio_data(data)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Audio data sent to STT: %d bytes", len(data))
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import Dict, List, Callable, Any
+from typing import Dict, Tuple, Callable, Any
 
 from component.stt import STTProcessor
 
@@ -10,8 +10,9 @@ class CommandHandler:
     """
 
     def __init__(self):
-        # Dictionary to store listeners by message type
-        self.listeners: Dict[str, List[Callable[[Any], None]]] = {}
+        # Dictionary to store listeners by message type. The tuples are replaced, never
+        # mutated, so a dispatch in progress keeps iterating the snapshot it started with
+        self.listeners: Dict[str, Tuple[Callable[[Any], None], ...]] = {}
 
     def register_listener(self, message_type: str, listener: Callable[[Any], None]) -> None:
         """
@@ -21,11 +22,9 @@ class CommandHandler:
             message_type: The type of message to listen for
             listener: The callback function to be called when a message of this type is received
         """
-        if message_type not in self.listeners:
-            self.listeners[message_type] = []
-
-        if listener not in self.listeners[message_type]:
-            self.listeners[message_type].append(listener)
+        listeners = self.listeners.get(message_type, ())
+        if listener not in listeners:
+            self.listeners[message_type] = listeners + (listener,)
             print(f"Listener registered for message type: {message_type}")
 
     def unregister_listener(self, message_type: str, listener: Callable[[Any], None]) -> bool:
@@ -39,12 +38,15 @@ class CommandHandler:
         Returns:
             bool: True if the listener was removed, False otherwise
         """
-        if message_type in self.listeners and listener in self.listeners[message_type]:
-            self.listeners[message_type].remove(listener)
+        listeners = self.listeners.get(message_type, ())
+        if listener in listeners:
+            remaining = tuple(registered for registered in listeners if registered != listener)
             print(f"Listener unregistered for message type: {message_type}")
 
-            # Clean up empty listener lists
-            if not self.listeners[message_type]:
+            # Clean up empty listener tuples
+            if remaining:
+                self.listeners[message_type] = remaining
+            else:
                 del self.listeners[message_type]
 
             return True
@@ -61,11 +63,8 @@ class CommandHandler:
         Returns:
             int: The number of listeners that received the message
         """
-        if message_type not in self.listeners:
-            return 0
-
         listener_count = 0
-        for listener in self.listeners[message_type]:
+        for listener in self.listeners.get(message_type, ()):
             try:
                 listener(message_data)
                 listener_count += 1
@@ -86,7 +85,7 @@ class CommandHandler:
             int: The number of listeners
         """
         if message_type:
-            return len(self.listeners.get(message_type, []))
+            return len(self.listeners.get(message_type, ()))
 
         # Count all listeners across all message types
         return sum(len(listeners) for listeners in self.listeners.values())
@@ -0,0 +1,78 @@
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class SessionMap:
+    """
+    Thread-safe session registry, sharded by session id.
+    Each shard has its own lock, so starting and stopping unrelated
+    sessions from different request threads does not contend.
+    """
+
+    def __init__(self, shards: int = 16):
+        """
+        Initialize the session map
+
+        Args:
+            shards: Number of shards, must be a power of two
+        """
+        if shards <= 0 or shards & (shards - 1):
+            raise ValueError("shards must be a power of two")
+
+        self._mask = shards - 1
+        self._shards: List[Tuple[Dict[str, Any], threading.Lock]] = [
+            ({}, threading.Lock()) for _ in range(shards)
+        ]
+
+    def _shard(self, session_id: str) -> Tuple[Dict[str, Any], threading.Lock]:
+        return self._shards[hash(session_id) & self._mask]
+
+    def get(self, session_id: str, default: Any = None) -> Any:
+        """
+        Get the session stored under a session id.
+
+        Args:
+            session_id: The session id
+            default: Value returned when the session does not exist
+
+        Returns:
+            The stored session, or default
+        """
+        sessions, lock = self._shard(session_id)
+        with lock:
+            return sessions.get(session_id, default)
+
+    def set(self, session_id: str, session: Any) -> None:
+        """
+        Store a session under a session id.
+
+        Args:
+            session_id: The session id
+            session: The session to store
+        """
+        sessions, lock = self._shard(session_id)
+        with lock:
+            sessions[session_id] = session
+
+    def pop(self, session_id: str, default: Any = None) -> Optional[Any]:
+        """
+        Remove and return the session stored under a session id.
+
+        Args:
+            session_id: The session id
+            default: Value returned when the session does not exist
+
+        Returns:
+            The removed session, or default
+        """
+        sessions, lock = self._shard(session_id)
+        with lock:
+            return sessions.pop(session_id, default)
+
+    def __contains__(self, session_id: str) -> bool:
+        sessions, lock = self._shard(session_id)
+        with lock:
+            return session_id in sessions
+
+    def __len__(self) -> int:
+        return sum(len(sessions) for sessions, _ in self._shards)
@@ -1,3 +1,6 @@
+// Size of the binary header in front of each audio frame
+const AUDIO_HEADER_SIZE = 8;
+
 /**
  * Audio recording and processing
  */
@@ -68,17 +71,15 @@ class AudioRecorder {
                 pcm16Data[i] = Math.max(-1, Math.min(1, float32Array[i])) * 0x7FFF;
             }
 
-            const metadata = JSON.stringify({ sampleRate: 16000 });
-            const metadataLength = new Uint32Array([metadata.length]);
-            const metadataBuffer = new TextEncoder().encode(metadata);
-
-            const message = new Uint8Array(
-                metadataLength.byteLength + metadataBuffer.byteLength + pcm16Data.byteLength
-            );
+            // Fixed 8-byte little-endian header:
+            // sample rate (uint32), format id (uint8, 0 = PCM16), channels (uint8), 2 padding bytes
+            const message = new Uint8Array(AUDIO_HEADER_SIZE + pcm16Data.byteLength);
+            const header = new DataView(message.buffer, 0, AUDIO_HEADER_SIZE);
+            header.setUint32(0, 16000, true);
+            header.setUint8(4, 0);
+            header.setUint8(5, 1);
 
-            message.set(new Uint8Array(metadataLength.buffer), 0);
-            message.set(metadataBuffer, metadataLength.byteLength);
-            message.set(new Uint8Array(pcm16Data.buffer), metadataLength.byteLength + metadataBuffer.byteLength);
+            message.set(new Uint8Array(pcm16Data.buffer), AUDIO_HEADER_SIZE);
 
             this.websocketHandler.getWebSocket().send(message);
         }
@@ -78,74 +78,84 @@ class WebSocketHandler {
             try {
                 data = JSON.parse(event.data);
 
-                // Process different message types
-                if (data.type) {
-                    switch (data.type) {
-                        case 'realtime':
-                        case 'transcription':
-                            // Realtime transcription updates
-                            this._notifyListeners('transcription', {
-                                text: data.text,
-                                isFinal: false
-                            });
-
-                            // Update UI with original text
-                            const originalTextElement = document.getElementById('original-text');
-                            if (originalTextElement) {
-                                originalTextElement.textContent = data.text;
-                            }
-                            break;
-
-                        case 'fullSentence':
-                            // Complete sentence transcription
-                            this._notifyListeners('fullSentence', {
-                                text: data.text,
-                                isFinal: true
-                            });
-
-                            // Update UI with final original text
-                            const finalOriginalTextElement = document.getElementById('original-text');
-                            if (finalOriginalTextElement) {
-                                finalOriginalTextElement.textContent = data.text;
-                            }
-                            break;
-
-                        case 'translation':
-                            // Translation result
-                            this._notifyListeners('translation', {
-                                original: data.original,
-                                translated: data.translated,
-                                isFinal: data.is_final
-                            });
-
-                            // Update UI with translated text
-                            const translatedTextElement = document.getElementById('translated-text');
-                            if (translatedTextElement) {
-                                translatedTextElement.textContent = data.translated;
-                            }
-                            break;
-
-                        case 'recording_start':
-                        case 'recording_stop':
-                        case 'vad_detect_start':
-                        case 'vad_detect_stop':
-                        case 'transcription_start':
-                        case 'start_turn_detection':
-                        case 'stop_turn_detection':
-                            // Handle various STT events
-                            this._notifyListeners(data.type, data);
-                            break;
-
-                        default:
-                            console.log('Received unknown message type:', data);
-                    }
-                }
+                // The server batches messages into one JSON array per frame
+                const messages = Array.isArray(data) ? data : [data];
+                messages.forEach(message => this._handleMessage(message));
             } catch (error) {
                 console.error('Error parsing WebSocket message:', error, event.data);
             }
         };
     }
 
+    /**
+     * Handle a single message received from the server
+     * @param {object} data - Parsed message
+     * @private
+     */
+    _handleMessage(data) {
+        if (data.type) {
+            switch (data.type) {
+                case 'realtime':
+                case 'transcription':
+                    // Realtime transcription updates
+                    this._notifyListeners('transcription', {
+                        text: data.text,
+                        isFinal: false
+                    });
+
+                    // Update UI with original text
+                    const originalTextElement = document.getElementById('original-text');
+                    if (originalTextElement) {
+                        originalTextElement.textContent = data.text;
+                    }
+                    break;
+
+                case 'fullSentence':
+                    // Complete sentence transcription
+                    this._notifyListeners('fullSentence', {
+                        text: data.text,
+                        isFinal: true
+                    });
+
+                    // Update UI with final original text
+                    const finalOriginalTextElement = document.getElementById('original-text');
+                    if (finalOriginalTextElement) {
+                        finalOriginalTextElement.textContent = data.text;
+                    }
+                    break;
+
+                case 'translation':
+                    // Translation result
+                    this._notifyListeners('translation', {
+                        original: data.original,
+                        translated: data.translated,
+                        isFinal: data.is_final
+                    });
+
+                    // Update UI with translated text
+                    const translatedTextElement = document.getElementById('translated-text');
+                    if (translatedTextElement) {
+                        translatedTextElement.textContent = data.translated;
+                    }
+                    break;
+
+                case 'recording_start':
+                case 'recording_stop':
+                case 'vad_detect_start':
+                case 'vad_detect_stop':
+                case 'transcription_start':
+                case 'start_turn_detection':
+                case 'stop_turn_detection':
+                    // Handle various STT events
+                    this._notifyListeners(data.type, data);
+                    break;
+
+                default:
+                    console.log('Received unknown message type:', data);
+            }
+        }
+    }
+
     /**
      * Disconnect from WebSocket server
      */
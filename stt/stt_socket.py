@@ -121,9 +121,13 @@ check_and_install_packages([
         'module_name': 'numpy',  # Import module
         'install_name': 'numpy',  # Package name for pip install
     },
+    {
+        'module_name': 'orjson',  # Import module
+        'install_name': 'orjson',  # Package name for pip install
+    },
     {
         'module_name': 'scipy.signal',  # Submodule of scipy
-        'attribute': 'resample',  # Specific function to check
+        'attribute': 'resample_poly',  # Specific function to check
         'install_name': 'scipy',  # Package name for pip install
     }
 ])
@@ -150,14 +154,17 @@ from colorama import init, Fore, Style
 init()
 
 from RealtimeSTT import AudioToTextRecorder
-from scipy.signal import resample
+from scipy.signal import resample_poly
 import numpy as np
+import orjson
 import websockets
 import threading
 import logging
 import wave
 import json
 import time
+import math
+import functools
 
 global_args = None
 recorder = None
@@ -197,6 +204,23 @@ data_connections = set()
 control_queue = asyncio.Queue()
 audio_queue = asyncio.Queue()
 
+# Realtime text waiting to be broadcast is held by a RealtimeSlot, which marks its place in
+# audio_queue. While the slot is open, newer partials replace its text. Queueing any other
+# message seals it: the slot still sends its latest text, and the next partial opens a new
+# slot behind that message, so partials and other messages keep their order
+class RealtimeSlot:
+    __slots__ = ('message',)
+
+    def __init__(self, message):
+        self.message = message
+
+
+pending_realtime = None
+pending_realtime_lock = threading.Lock()
+# Only the text of a realtime message changes, so the envelope around it is built once
+REALTIME_PREFIX = b'{"type":"realtime","text":'
+REALTIME_SUFFIX = b'}'
+
 
 def preprocess_text(text):
     # Remove leading whitespaces
@@ -247,8 +271,25 @@ def format_timestamp_ns(timestamp_ns: int) -> str:
     return formatted_timestamp
 
 
+def take_pending_realtime(slot):
+    global pending_realtime
+    with pending_realtime_lock:
+        # Once taken, the slot can't be updated any more
+        if pending_realtime is slot:
+            pending_realtime = None
+        return slot.message
+
+
+def queue_message(message, loop):
+    global pending_realtime
+    # Enqueued under the lock so queue order matches the order slots are sealed in
+    with pending_realtime_lock:
+        pending_realtime = None
+        loop.call_soon_threadsafe(audio_queue.put_nowait, message)
+
+
 def text_detected(text, loop):
-    global prev_text
+    global prev_text, pending_realtime
 
     text = preprocess_text(text)
 
@@ -298,12 +339,15 @@ def text_detected(text, loop):
 
     prev_text = text
 
-    # Put the message in the audio queue to be sent to clients
-    message = json.dumps({
-        'type': 'realtime',
-        'text': text
-    })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    # Put the message in the audio queue to be sent to clients, unless an older partial
+    # is still waiting in an open slot, in which case it is replaced by this one
+    message = REALTIME_PREFIX + orjson.dumps(text) + REALTIME_SUFFIX
+    with pending_realtime_lock:
+        if pending_realtime is not None:
+            pending_realtime.message = message
+        else:
+            pending_realtime = RealtimeSlot(message)
+            loop.call_soon_threadsafe(audio_queue.put_nowait, pending_realtime)
 
     # Get current timestamp in HH:MM:SS.nnn format
     timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
@@ -318,49 +362,49 @@ def on_recording_start(loop):
     message = json.dumps({
         'type': 'recording_start'
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 def on_recording_stop(loop):
     message = json.dumps({
         'type': 'recording_stop'
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 def on_vad_detect_start(loop):
     message = json.dumps({
         'type': 'vad_detect_start'
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 def on_vad_detect_stop(loop):
     message = json.dumps({
         'type': 'vad_detect_stop'
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 def on_wakeword_detected(loop):
     message = json.dumps({
         'type': 'wakeword_detected'
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 def on_wakeword_detection_start(loop):
     message = json.dumps({
         'type': 'wakeword_detection_start'
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 def on_wakeword_detection_end(loop):
     message = json.dumps({
         'type': 'wakeword_detection_end'
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 def on_transcription_start(_audio_bytes, loop):
@@ -369,7 +413,7 @@ def on_transcription_start(_audio_bytes, loop):
         'type': 'transcription_start',
         'audio_bytes_base64': bytes_b64
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 def on_turn_detection_start(loop):
@@ -377,7 +421,7 @@ def on_turn_detection_start(loop):
     message = json.dumps({
         'type': 'start_turn_detection'
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 def on_turn_detection_stop(loop):
@@ -385,7 +429,7 @@ def on_turn_detection_stop(loop):
     message = json.dumps({
         'type': 'stop_turn_detection'
     })
-    asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+    queue_message(message, loop)
 
 
 # def on_realtime_transcription_update(text, loop):
@@ -605,7 +649,7 @@ def _recorder_thread(loop):
             'text': full_sentence
         })
         # Use the passed event loop here
-        asyncio.run_coroutine_threadsafe(audio_queue.put(message), loop)
+        queue_message(message, loop)
 
         timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
 
@@ -624,6 +668,13 @@ def _recorder_thread(loop):
         print(f"{bcolors.WARNING}Exiting application due to keyboard interrupt{bcolors.ENDC}")
 
 
+@functools.lru_cache(maxsize=None)
+def resample_factors(original_sample_rate, target_sample_rate):
+    # Reduce the conversion ratio to its smallest up/down factors, once per rate pair
+    g = math.gcd(original_sample_rate, target_sample_rate)
+    return target_sample_rate // g, original_sample_rate // g
+
+
 def decode_and_resample(
         audio_data,
         original_sample_rate,
@@ -634,13 +685,9 @@ def decode_and_resample(
 
     audio_np = np.frombuffer(audio_data, dtype=np.int16)
 
-    # Calculate the number of samples after resampling
-    num_original_samples = len(audio_np)
-    num_target_samples = int(num_original_samples * target_sample_rate /
-                             original_sample_rate)
-
-    # Resample the audio
-    resampled_audio = resample(audio_np, num_target_samples)
+    # Resample the audio with a polyphase FIR filter instead of an FFT over the whole chunk
+    up, down = resample_factors(int(original_sample_rate), int(target_sample_rate))
+    resampled_audio = resample_poly(audio_np, up, down)
 
     return resampled_audio.astype(np.int16).tobytes()
 
@@ -769,10 +816,11 @@ async def data_handler(websocket):
                     debug_print(f"Received audio chunk (size: {len(message)} bytes)")
                 elif log_incoming_chunks:
                     print(".", end='', flush=True)
-                # Handle binary message (audio data)
-                metadata_length = int.from_bytes(message[:4], byteorder='little')
-                metadata_json = message[4:4 + metadata_length].decode('utf-8')
-                metadata = json.loads(metadata_json)
+                # Handle binary message (audio data); slices of the memoryview share the
+                # message buffer, so the audio chunk is not copied out of it
+                message_view = memoryview(message)
+                metadata_length = int.from_bytes(message_view[:4], byteorder='little')
+                metadata = json.loads(bytes(message_view[4:4 + metadata_length]))
                 sample_rate = metadata['sampleRate']
 
                 if 'server_sent_to_stt' in metadata:
@@ -783,7 +831,7 @@ async def data_handler(websocket):
 
                 if extended_logging:
                     debug_print(f"Processing audio chunk with sample rate {sample_rate}")
-                chunk = message[4 + metadata_length:]
+                chunk = message_view[4 + metadata_length:]
 
                 if writechunks:
                     if not wav_file:
@@ -813,6 +861,8 @@ async def data_handler(websocket):
 async def broadcast_audio_messages():
     while True:
         message = await audio_queue.get()
+        if isinstance(message, RealtimeSlot):
+            message = take_pending_realtime(message)
         for conn in list(data_connections):
             try:
                 timestamp = datetime.now().strftime('%H:%M:%S.%f')[:-3]
@@ -820,7 +870,8 @@ async def broadcast_audio_messages():
                 if extended_logging:
                     print(f"  [{timestamp}] Sending message: {bcolors.OKBLUE}{message}{bcolors.ENDC}\n", flush=True,
                           end="")
-                await conn.send(message)
+                # Realtime messages are orjson bytes; send every message as a text frame
+                await conn.send(message, text=True)
             except websockets.exceptions.ConnectionClosed:
                 data_connections.remove(conn)
 
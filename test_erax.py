@@ -23,14 +23,17 @@ hi_text = hi_text.replace("。", "。\n").replace("！", "！\n").replace("？",
 hi_text = [s.strip() for s in hi_text.split("\n") if s.strip()]
 print(f"Number of sentences to translate: {len(hi_text)}")
 
-# Translate each sentence
-for i, sentence in enumerate(hi_text):
-    start = time.time()
-    encoded = tokenizer(sentence, return_tensors="pt").to(device)  # ← move to GPU
+# Translate all sentences in one padded batch
+start = time.time()
+encoded = tokenizer(hi_text, return_tensors="pt", padding=True, truncation=True).to(device)  # ← move to GPU
+with torch.inference_mode():
     generated_tokens = model.generate(
-        **encoded, forced_bos_token_id=tokenizer.get_lang_id("vi")
+        **encoded, forced_bos_token_id=tokenizer.get_lang_id("vi"), num_beams=1
     )
-    trans = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+translations = tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+elapsed = time.time() - start
+
+for i, trans in enumerate(translations):
     print(f"\nTranslation {i + 1}/{len(hi_text)}:")
-    print(trans[0])
-    print(f"Translation took {time.time() - start:.2f} seconds.")
\ No newline at end of file
+    print(trans)
+print(f"\nBatch of {len(hi_text)} sentences took {elapsed:.2f} seconds.")
\ No newline at end of file
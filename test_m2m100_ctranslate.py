@@ -1,13 +1,24 @@
+import os
+
 import ctranslate2
 import sentencepiece as spm
-from transformers import M2M100Tokenizer
-import torch
-
-# Load tokenizer
-tokenizer = M2M100Tokenizer.from_pretrained("facebook/m2m100_418M")
 
-# Load CTranslate2 translator
-translator = ctranslate2.Translator("m2m100_ct2", device="cpu")  # or "cuda" for GPU
+# Load CTranslate2 translator. Convert the model with int8 weights first:
+#   ct2-transformers-converter --model facebook/m2m100_418M --output_dir m2m100_ct2 --quantization int8 \
+#       --copy_files sentencepiece.bpe.model
+cuda_device_count = ctranslate2.get_cuda_device_count()
+device = "cuda" if cuda_device_count else "cpu"
+# int8 GEMMs on CPU; int8 weights with float16 activations on GPU
+compute_type = "int8_float16" if device == "cuda" else "int8"
+translator = ctranslate2.Translator(
+    "m2m100_ct2",
+    device=device,
+    # One translator replica per GPU
+    device_index=list(range(cuda_device_count)) if device == "cuda" else 0,
+    compute_type=compute_type,
+    inter_threads=1,
+    intra_threads=os.cpu_count()
+)
 
 # Load SentencePiece model
 sp = spm.SentencePieceProcessor()
@@ -21,20 +32,34 @@ source_text = """
 source_lang = "ja"
 target_lang = "vi"
 
-# Set language tokens
-tokenizer.src_lang = source_lang
-input_tokens = tokenizer.tokenize(source_text)
-input_ids = tokenizer.convert_tokens_to_ids([f"__{source_lang}__"] + input_tokens)
+# Split into sentences so they go through one translate_batch call together
+sentences = source_text.replace("。", "。\n").replace("！", "！\n").replace("？", "？\n").strip()
+sentences = [s.strip() for s in sentences.split("\n") if s.strip()]
+
+# CTranslate2 takes string tokens, so the SentencePiece pieces are used as they are,
+# wrapped in the source language token and the end of sentence token.
+# The one processor serves both directions, and encodes the whole list across all cores
+source_token = f"__{source_lang}__"
+pieces_batch = sp.encode(sentences, out_type=str, enable_sampling=False, num_threads=os.cpu_count())
+all_tokens = [[source_token] + pieces + ["</s>"] for pieces in pieces_batch]
 
-# Convert to string tokens for CTranslate2
-tokens = tokenizer.convert_ids_to_tokens(input_ids)
+# Run translation on length-sorted inputs, batched by a token budget so padding stays small
+order = sorted(range(len(all_tokens)), key=lambda i: len(all_tokens[i]))
+results = translator.translate_batch(
+    [all_tokens[i] for i in order],
+    target_prefix=[[f"__{target_lang}__"]] * len(all_tokens),
+    max_batch_size=2048,
+    batch_type="tokens"
+)
 
-# Run translation
-results = translator.translate_batch([tokens], target_prefix=[[f"__{target_lang}__"]])
-output_tokens = results[0].hypotheses[0]
+# Put the results back in sentence order
+ordered_results = [None] * len(results)
+for i, result in zip(order, results):
+    ordered_results[i] = result
 
-# Detokenize output
-output_ids = tokenizer.convert_tokens_to_ids(output_tokens)
-translated_text = tokenizer.decode(output_ids, skip_special_tokens=True)
+# Detokenize output in one call; each hypothesis starts with the target language token
+translated_texts = sp.decode([result.hypotheses[0][1:] for result in ordered_results])
 
-print("Translated:", translated_text)
+for sentence, translated_text in zip(sentences, translated_texts):
+    print("Source:", sentence)
+    print("Translated:", translated_text)
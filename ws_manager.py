@@ -3,9 +3,9 @@ import json
 import logging
 import queue
 import threading
-import time
 from asyncio import AbstractEventLoop
 
+import orjson
 import websockets
 
 from component import stt, translation
@@ -14,6 +14,43 @@ from handler.command_handler import CommandHandler
 
 logger = logging.getLogger("ws_audio")
 
+# Outgoing messages already waiting when the sender wakes up are sent together, up to SEND_BATCH_SIZE
+SEND_BATCH_SIZE = 16
+
+
+class LoopQueue:
+    """
+    Queue that component threads put into and the websocket event loop awaits.
+    put() hands each item to the loop with call_soon_threadsafe, so the sender
+    sleeps in get() until a message exists instead of polling.
+    """
+
+    def __init__(self, loop: AbstractEventLoop):
+        """
+        Initialize the queue
+
+        Args:
+            loop: The event loop that consumes the queue
+        """
+        self._loop = loop
+        self._queue = asyncio.Queue()
+
+    def put(self, item) -> None:
+        """Add an item from any thread"""
+        try:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+        except RuntimeError:
+            # The loop is already closed, so there is no client left to send to
+            pass
+
+    async def get(self):
+        """Wait for the next item; only call from the event loop"""
+        return await self._queue.get()
+
+    def get_nowait(self):
+        """Take the next item, raising asyncio.QueueEmpty if there is none; only call from the event loop"""
+        return self._queue.get_nowait()
+
 class WebsocketManager:
     def __init__(self,
                  host="localhost",
@@ -24,13 +61,17 @@ class WebsocketManager:
         self.host = host
         self.port = 0  # Port will be set later
         self.clients = set()
+        self.client_connected = asyncio.Event()  # Set while at least one client is connected
         self.websocket = None
         self.ws_thread = None
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()  # Set once the server is listening and the port is known
 
         # Initialize queues for communication between components
-        self.shared_queue = queue.Queue() # Shared queue for broadcast messages
-        self.stt_to_translator_queue = queue.Queue()  # Queue for STT to Translation
-        self.translator_to_tts_queue = queue.Queue()  # Queue for Translation to TTS
+        self.shared_queue = LoopQueue(self.loop) # Shared queue for broadcast messages, consumed on the websocket loop
+        # Unbounded and never joined, so the lighter SimpleQueue is enough
+        self.stt_to_translator_queue = queue.SimpleQueue()  # Queue for STT to Translation
+        self.translator_to_tts_queue = queue.SimpleQueue()  # Queue for Translation to TTS
 
         print("Create STT processor")
         # Create component instances
@@ -55,63 +96,96 @@ class WebsocketManager:
     async def _handler(self, websocket : websockets.ServerConnection):
         logger.info(f"Audio client connected: {websocket}")
         self.clients.add(websocket)
-        send_task = None
+        self.client_connected.set()
         try:
-            # Set up a task to send messages to this client
-            send_task = asyncio.create_task(self._send_messages_to_client(websocket))
-
             async for message in websocket:
                 try:
                     if isinstance(message, bytes):
-                        print(f"Received audio data. Sending to AudioSocketHandler")
+                        logger.debug("Received audio data. Sending to AudioSocketHandler")
                         self.audio_socket_handler.handle_audio_data(message)
                     else:
                         data = json.loads(message)
                         if not data or 'command' not in data:
-                            print("Invalid message format received")
+                            logger.warning("Invalid message format received")
                             continue
 
                         cnt_listeners = self.command_handler.handle_message(data.get('command'), data)
-                        print(f"Command '{data.get('command')}' processed, {cnt_listeners} listeners notified")
+                        logger.debug("Command '%s' processed, %d listeners notified", data.get('command'), cnt_listeners)
 
                 except json.JSONDecodeError as e:
-                    print(f"JSON decode error: {str(e)}")
+                    logger.warning("JSON decode error: %s", e)
                 except Exception as e:
-                    print(f"Audio WS error: {str(e)}")
+                    logger.error("Audio WS error: %s", e)
 
         except Exception as e:
             logger.error(f"Audio WS error: {str(e)}")
         finally:
             self.clients.remove(websocket)
+            if not self.clients:
+                self.client_connected.clear()
             logger.info(f"Audio client disconnected: {websocket}")
-            if send_task:
-                send_task.cancel()
 
 
-    async def _send_messages_to_client(self, websocket : websockets.ServerConnection):
+    async def _broadcast_messages(self):
         """
-        Sends messages to the websocket client and relevant services.
+        Sends messages to all websocket clients and relevant services.
+        Messages pending together are serialized once as a single JSON array
+        frame and sent to every client concurrently.
         """
         while True:
             try:
-                while not self.shared_queue.empty():
-                    message = self.shared_queue.get()
-                    if not message or 'type' not in message:
-                        print("Invalid message format in shared queue")
-
-                    type = message['type']
-                    await websocket.send(json.dumps(message))
-                    print(f"Sent message to client: {type}, message: {message}")
+                # Leave messages queued until someone is connected to receive them
+                await self.client_connected.wait()
+                batch = await self._next_batch()
+                if not batch:
+                    continue
+
+                # Messages are serialized one by one so a bad one doesn't take the rest of the batch with it
+                encoded = []
+                for message in batch:
+                    try:
+                        encoded.append(orjson.dumps(message))
+                    except orjson.JSONEncodeError as e:
+                        logger.error("Dropping unserializable '%s' message: %s", message['type'], e)
+
+                if encoded:
+                    payload = b'[' + b','.join(encoded) + b']'
+                    # A client that fails or is closing doesn't stop the others; its error is dropped
+                    # here and the connection is removed by its own handler
+                    await asyncio.gather(*(client.send(payload, text=True) for client in list(self.clients)),
+                                         return_exceptions=True)
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Sent %d messages to %d clients: %s", len(encoded), len(self.clients),
+                                     [message['type'] for message in batch])
+
+                for message in batch:
                     as_command = message.get('as_command', False)
                     if as_command:
+                        type = message['type']
                         cnt_listeners = self.command_handler.handle_message(type, message)
-                        print(f"Command '{type}' processed, {cnt_listeners} listeners notified")
-            except queue.Empty:
-                await asyncio.sleep(0.05)
+                        logger.debug("Command '%s' processed, %d listeners notified", type, cnt_listeners)
             except Exception as e:
                 logger.error(f"Error sending message to client: {str(e)}")
                 await asyncio.sleep(0.1)
 
+    async def _next_batch(self) -> list:
+        """Wait for a message on the shared queue, then take up to SEND_BATCH_SIZE of those pending"""
+        message = await self.shared_queue.get()
+        batch = []
+        while True:
+            if not message or 'type' not in message:
+                logger.warning("Invalid message format in shared queue")
+            else:
+                batch.append(message)
+
+            if len(batch) >= SEND_BATCH_SIZE:
+                break
+            try:
+                message = self.shared_queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
 
     def _run_server(self, loop : AbstractEventLoop):
         print("Starting Audio WebSocket server")
@@ -132,22 +206,22 @@ class WebsocketManager:
                 if socket and socket.getsockname()[1]:
                     self.port = socket.getsockname()[1]
             self.websocket = websocket
-            await asyncio.Future()
+            broadcast_task = asyncio.create_task(self._broadcast_messages())
+            self.ready.set()
+            try:
+                await asyncio.Future()
+            finally:
+                broadcast_task.cancel()
 
     def start(self) -> int:
         print("Creating thread for Audio WebSocket server")
-        loop = asyncio.new_event_loop()
-        self.ws_thread = threading.Thread(target=self._run_server, args=(loop,), daemon=True)
+        self.ws_thread = threading.Thread(target=self._run_server, args=(self.loop,), daemon=True)
         self.ws_thread.start()
 
-        # After starting the thread, wait for the server to start to get the port
-        start_time = time.time()
-        while not self.websocket:
-            # Wait for max 2 seconds
-            if time.time() - start_time > 2:
-                print("Timeout waiting for WebSocket server to start")
-                return -1
-            start_time = time.time()
+        # After starting the thread, wait for max 2 seconds for the server to start to get the port
+        if not self.ready.wait(timeout=2):
+            print("Timeout waiting for WebSocket server to start")
+            return -1
 
         print(f"Audio WebSocket server started on ws://{self.host}:{self.port}")
         return self.port
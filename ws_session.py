@@ -4,10 +4,15 @@ import queue
 import logging
 import json
 import asyncio
-import time
 
+import orjson
 import websockets
 from component import stt, translation
+from ws_manager import LoopQueue
+
+# Partial transcriptions are the busiest message; only their text is serialized per message
+_PARTIAL_PREFIX = b'{"type":"transcription","is_final":false,"text":'
+_PARTIAL_SUFFIX = b'}'
 
 
 class WebsocketSession:
@@ -25,20 +30,15 @@ class WebsocketSession:
         """
         self.websocket_port = websocket_port
         self.logger = logging.getLogger("WebsocketSession")
+        self.loop = asyncio.new_event_loop()
 
-        # Set up queues for communication between components
+        # Set up queues for communication between components. Queues read by the
+        # websocket loop are LoopQueues, so the sender awaits them instead of polling
         self.stt_input_queue = asyncio.Queue()  # Audio data in
         self.stt_to_translator_queue = queue.Queue()  # Transcribed text
-        self.translator_to_tts_queue = queue.Queue()  # Translated text
-        self.tts_output_queue = queue.Queue()  # Audio data out
-        self.websocket_output_queue = queue.Queue()  # Messages to send to client
-        self.shared_queue = queue.Queue()  # Shared queue for inter-component communication
-
-        # Start the queue monitor in a separate thread
-        self.queue_monitor_thread = threading.Thread(
-            target=self._monitor_component_queues,
-            daemon=True
-        )
+        self.translator_to_tts_queue = LoopQueue(self.loop)  # Translated text
+        self.websocket_output_queue = LoopQueue(self.loop)  # Messages to send to client
+        self.shared_queue = LoopQueue(self.loop)  # Shared queue for inter-component communication
 
         print("Create STT processor")
         # Create component instances
@@ -58,7 +58,7 @@ class WebsocketSession:
         # self.tts_processor = TTSProcessor(
         #     config.get('tts_config', {}),
         #     self.translator_to_tts_queue,
-        #     self.tts_output_queue
+        #     self.websocket_output_queue  # Audio out goes straight to the client sender
         # )
         self.tts_processor = None
 
@@ -128,54 +128,67 @@ class WebsocketSession:
             send_task.cancel()
 
     async def _send_messages_to_client(self, websocket):
-        """Send messages from the output queue to the client"""
-        while True:
-            try:
-                while not self.shared_queue.empty():
-                    message = self.shared_queue.get(block=False)
-                    if message['type'] == 'transcription':
-                        print(f"Sending transcription to client: {message}")
-                        # request translation for the transcription
-                        self.stt_to_translator_queue.put(message)
-                        # Currently, we're not sending audio back to client
-                        # But you could implement this if needed
-                        pass
-
-                # Check if there are messages to process from STT or translation
-                while not self.stt_to_translator_queue.empty():
-                    message = self.stt_to_translator_queue.get(block=False)
-                    if message['type'] == 'transcription':
-                        print(f"Sending transcription to client: {message}")
-                        # Send transcription to client
-                        await websocket.send(json.dumps({
-                            'type': 'transcription',
-                            'text': message['text'],
-                            'is_final': message.get('is_final', False)
-                        }))
-
-                while not self.translator_to_tts_queue.empty():
-                    message = self.translator_to_tts_queue.get(block=False)
-                    if message['type'] == 'translation':
-                        # Send translation to client
-                        await websocket.send(json.dumps({
-                            'type': 'translation',
-                            'original': message['original'],
-                            'translated': message['translated'],
-                            'is_final': message.get('is_final', False)
-                        }))
-
-                # Check the dedicated websocket queue
-                while not self.websocket_output_queue.empty():
-                    message = self.websocket_output_queue.get(block=False)
-                    await websocket.send(json.dumps(message))
-
-                # Short delay to prevent CPU hogging
-                await asyncio.sleep(0.05)
-            except queue.Empty:
-                await asyncio.sleep(0.05)
-            except Exception as e:
-                self.logger.error(f"Error sending message to client: {str(e)}")
-                await asyncio.sleep(0.1)
+        """Send messages from the component queues to the client as soon as any of them has one"""
+        queues = {
+            'shared': self.shared_queue,
+            'translation': self.translator_to_tts_queue,
+            'websocket': self.websocket_output_queue
+        }
+        # One pending get() per queue, kept across iterations and only replaced once it completes
+        getters = {asyncio.create_task(q.get()): name for name, q in queues.items()}
+        try:
+            while True:
+                done, _ = await asyncio.wait(getters, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = getters.pop(task)
+                    getters[asyncio.create_task(queues[name].get())] = name
+                    try:
+                        await self._dispatch_message(websocket, name, task.result())
+                    except Exception as e:
+                        self.logger.error(f"Error sending message to client: {str(e)}")
+        finally:
+            for task in getters:
+                task.cancel()
+
+    async def _dispatch_message(self, websocket, queue_name, message):
+        """
+        Forward one message taken from a component queue
+
+        Args:
+            websocket: The client connection
+            queue_name: Name of the queue the message came from
+            message: The message
+        """
+        if queue_name == 'shared':
+            if message['type'] == 'transcription':
+                if self.logger.isEnabledFor(logging.DEBUG):
+                    self.logger.debug("Sending transcription to client: %s", message)
+                # request translation for the transcription
+                self.stt_to_translator_queue.put(message)
+                # Send transcription to client
+                if message.get('is_final', False):
+                    payload = orjson.dumps({
+                        'type': 'transcription',
+                        'text': message['text'],
+                        'is_final': True
+                    })
+                else:
+                    # orjson.dumps of the text is the quoted, escaped JSON string
+                    payload = _PARTIAL_PREFIX + orjson.dumps(message['text']) + _PARTIAL_SUFFIX
+                await websocket.send(payload, text=True)
+
+        elif queue_name == 'translation':
+            if message['type'] == 'translation':
+                # Send translation to client
+                await websocket.send(orjson.dumps({
+                    'type': 'translation',
+                    'original': message['original'],
+                    'translated': message['translated'],
+                    'is_final': message.get('is_final', False)
+                }), text=True)
+
+        else:
+            await websocket.send(orjson.dumps(message), text=True)
 
     async def _run_websocket_server(self):
         """Run the WebSocket server"""
@@ -188,24 +201,6 @@ class WebsocketSession:
             self.websocket_server = server
             await asyncio.Future()  # Run forever
 
-    def _monitor_component_queues(self):
-        """Monitor and forward messages between component queues"""
-        while self.running:
-            try:
-                # Check TTS output queue and forward to websocket
-                if not self.tts_output_queue.empty():
-                    message = self.tts_output_queue.get(block=False)
-                    if message['type'] == 'tts_audio':
-                        # Currently, we're not sending audio back to client
-                        # But you could implement this if needed
-                        pass
-
-                time.sleep(0.01)  # Small sleep to prevent CPU hogging
-            except queue.Empty:
-                pass
-            except Exception as e:
-                self.logger.error(f"Error in queue monitor: {str(e)}")
-
     def start(self):
         """Start all components and the WebSocket server"""
         try:
@@ -213,22 +208,17 @@ class WebsocketSession:
             self.logger.info("Starting components")
             print("Starting components")
 
-            loop = asyncio.new_event_loop()
-            print("Get asyncio event loop")
 
             # Start the processors
             self.stt_processor.start()
             self.translator.start()
             # self.tts_processor.start()
 
-            print("Starting queue monitor thread")
-            self.queue_monitor_thread.start()
-
             # Start the WebSocket server in a separate thread
             print("Starting WebSocket server thread")
             self.websocket_thread = threading.Thread(
                 target=self._run_websocket_server_in_thread,
-                args=(loop,),
+                args=(self.loop,),
                 daemon=True
             )
             self.websocket_thread.start()
@@ -279,10 +269,6 @@ class WebsocketSession:
             except:
                 pass
 
-        print("Stopping queue monitor thread")
-        if self.queue_monitor_thread.is_alive():
-            self.queue_monitor_thread.join(timeout=1)
-
         print("WebSocket session stopped")
 
     async def _shutdown_after_disconnect(self):
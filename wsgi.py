@@ -0,0 +1,11 @@
+"""
+WSGI entry point for running the control plane under a production server.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Sessions (and their WebSocket servers) live in this process, so the server
+must run a single worker process and scale with threads instead.
+"""
+from app import app
+
+__all__ = ['app']